@@ -3,18 +3,37 @@ import os
 import sys
 import json
 import subprocess
+import shutil
 from argparse import ArgumentParser
 import logging
 import time
 import signal
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError
+import selectors
+import ssl
+import re
+import secrets
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit, urljoin, urlencode, parse_qs
 import hashlib
 import threading
-from typing import Optional, BinaryIO, List
+import functools
+from email.message import Message
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager
+from typing import Optional, BinaryIO, List, Dict, Iterator, Tuple
 
 
-_notification = ['echo', 'URL MSG']
+_notification_tmpl: Tuple[str, ...] = ()  # Set by set_notification().
+_user_agent = 'watch_url.py'
+_max_redirects = 5
+_max_drain = 64 * 1024  # Unread body bytes worth reading to keep a connection.
+_max_freshness = 3600.0  # Don't trust a server's max-age beyond this, in seconds.
+_thread_stack_size = 512 * 1024  # Watchers are shallow; don't reserve 8 MiB each.
+_callback: Optional[str] = None  # Public URL of our WebSub endpoint, if any.
+_verify_timeout = 60.0  # seconds to wait for a hub to verify a subscription
+_default_lease = 86400.0  # seconds, if the hub doesn't say
+_min_lease = 60.0  # seconds, so a tiny lease can't make us resubscribe nonstop
 notify_lock = threading.Lock()
 
 
@@ -25,27 +44,106 @@ def log_exit(sig: int, frame) -> None:
     sys.exit(0)
 
 
-def get_md5(f: BinaryIO) -> str:
-    """Make an MD5 hash of the page's contents."""
-    BLOCKSIZE = 65536
-    hasher = hashlib.md5()
-    buf = f.read(BLOCKSIZE)
-    while len(buf) > 0:
-        hasher.update(buf)
-        buf = f.read(BLOCKSIZE)
-    return hasher.hexdigest()
+class _HashSink:
+    """A write-only file object that feeds everything written to a hasher."""
+
+    def __init__(self, hasher) -> None:
+        self.hasher = hasher
+
+    def write(self, b: bytes) -> int:
+        self.hasher.update(b)
+        return len(b)
+
+
+def get_digest(f: BinaryIO) -> bytes:
+    """Make a SHA-256 hash of the page's contents."""
+    if hasattr(hashlib, 'file_digest'):  # Python 3.11+ hashes in C.
+        return hashlib.file_digest(f, 'sha256').digest()
+    hasher = hashlib.sha256()
+    shutil.copyfileobj(f, _HashSink(hasher), 1 << 20)
+    return hasher.digest()
+
+
+def same_etag(a: Optional[str], b: Optional[str]) -> bool:
+    """Compare ETags the way If-None-Match does, ignoring the weak prefix."""
+    if a is None or b is None:
+        return a == b
+    return a.removeprefix('W/') == b.removeprefix('W/')
+
+
+def freshness_lifetime(headers: Message) -> float:
+    """Return how many seconds a response may be considered unchanged."""
+    cache_control = [i.strip().lower() for i in
+                     headers.get('Cache-Control', '').split(',')]
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return 0.0
+    lifetime = None
+    for directive in cache_control:
+        if directive.startswith('max-age='):
+            try:
+                lifetime = float(directive[len('max-age='):].strip('"'))
+            except ValueError:
+                return 0.0
+    if lifetime is None and 'Expires' in headers:
+        try:
+            expires = parsedate_to_datetime(headers['Expires'])
+            date = parsedate_to_datetime(headers['Date']) if 'Date' in headers else None
+            lifetime = expires.timestamp() - (date.timestamp() if date else time.time())
+        except (TypeError, ValueError):
+            return 0.0
+    if lifetime is None:
+        return 0.0
+    try:
+        lifetime -= float(headers.get('Age', 0))
+    except ValueError:
+        pass
+    return max(0.0, min(lifetime, _max_freshness))
+
+
+def set_notification(notification: List[str]) -> None:
+    """Set the notification command, turning MSG and URL into format fields."""
+    global _notification_tmpl
+    _notification_tmpl = tuple(i.replace('{', '{{').replace('}', '}}')
+                               .replace('MSG', '{msg}').replace('URL', '{url}')
+                               for i in notification)
+    _build_cmd.cache_clear()
+
+
+@functools.lru_cache(maxsize=32)
+def _build_cmd(msg: str, url: str) -> Tuple[str, ...]:
+    """Substitute msg and url into the notification command. Cached, since
+    most notifications ("Watching", "Site changed") repeat."""
+    return tuple(i.format(msg=msg, url=url) for i in _notification_tmpl)
+
+
+set_notification(['echo', 'URL MSG'])
 
 
 def notify(msg: str, url: str='') -> str:
     """Send a notification to the user."""
     with notify_lock:
-        return run([i.replace('MSG', msg).replace('URL', url) for i in _notification])
+        command = list(_build_cmd(msg, url))
+        if command[0] == 'echo' and not any(i.startswith('-') for i in command[1:]):
+            # Fast path for the default template: skip the fork and exec.
+            logging.debug(f"echo {command[1:]}")
+            return ' '.join(command[1:]) + '\n'
+        return run(command)
+
+
+@functools.lru_cache(maxsize=8)
+def _which(command: str) -> str:
+    """The full path to command, or command itself if it isn't on the PATH."""
+    return shutil.which(command) or command
 
 
 def run(command_list: List[str]) -> str:
     """Pass in a linux command, get back the stdout."""
-    r = subprocess.run(command_list, stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE, encoding='utf-8')
+    # subprocess only uses posix_spawn() instead of fork() and exec() when the
+    # executable is a path and close_fds is off. Python's own descriptors
+    # aren't inheritable anyway (PEP 446), so nothing extra leaks to the child.
+    r = subprocess.run(command_list, executable=_which(command_list[0]),
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                       encoding='utf-8', close_fds=False)
     logging.debug(f"subprocess.run({command_list}) got {r.returncode}.")
     if r.returncode != 0:
         logging.error(f"subprocess.run({command_list}) failed with code {r.returncode}.")
@@ -53,62 +151,421 @@ def run(command_list: List[str]) -> str:
     return r.stdout
 
 
+class Connection:
+    """A keep-alive HTTP(S) connection to one host, reused across polls."""
+
+    def __init__(self, scheme: str, netloc: str, timeout: float=30.0) -> None:
+        # Watchers of URLs on the same host take turns with the connection.
+        self.lock = threading.Lock()
+        # Reconnect as soon as the server closes an idle connection, unless
+        # it closes those too quickly for that to help.
+        self.prewarm = True
+        self.prewarmed = False
+        if scheme == 'https':
+            self.conn: http.client.HTTPConnection = \
+                http.client.HTTPSConnection(netloc, timeout=timeout)
+        else:
+            self.conn = http.client.HTTPConnection(netloc, timeout=timeout)
+
+    def request(self, method: str, target: str, headers: Dict[str, str],
+                body: Optional[bytes]=None) -> http.client.HTTPResponse:
+        """Send a request, reconnecting once if the server dropped the idle connection."""
+        self.prewarmed = False
+        try:
+            self.conn.request(method, target, body, headers)
+            return self.conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionError):
+            logging.debug(f"Reconnecting to {self.conn.host}.")
+            self.conn.close()
+            self.conn.request(method, target, body, headers)
+            return self.conn.getresponse()
+
+    def wait(self, timeout: float) -> None:
+        """Sleep for timeout seconds. If the server closes the idle connection
+        meanwhile, reconnect right away rather than on the next request."""
+        deadline = time.monotonic() + timeout
+        while self.conn.sock is not None:
+            sock = self.conn.sock
+            try:
+                with selectors.DefaultSelector() as sel:
+                    sel.register(sock, selectors.EVENT_READ)
+                    if not sel.select(max(0.0, deadline - time.monotonic())):
+                        return
+                    # If another watcher holds the lock, it's their response
+                    # arriving. Otherwise the server may have closed it.
+                    if not self.lock.acquire(blocking=False):
+                        break
+                    try:
+                        if self.conn.sock is sock and self._is_closed(sock):
+                            self._reconnect_idle()
+                    finally:
+                        self.lock.release()
+            except (ValueError, OSError):
+                break  # Another watcher closed the socket first.
+        time.sleep(max(0.0, deadline - time.monotonic()))
+
+    @staticmethod
+    def _is_closed(sock) -> bool:
+        """Whether the server closed an idle, readable sock. Readable doesn't
+        always mean EOF: TLS 1.3 servers send session tickets after the
+        handshake, which the SSL layer consumes without any data for us."""
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            # Either EOF (b'') or junk that an idle HTTP/1.1 connection
+            # shouldn't have. Both mean the connection is unusable.
+            sock.recv(1)
+            return True
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        except OSError:
+            return True
+        finally:
+            sock.settimeout(timeout)
+
+    def _reconnect_idle(self) -> None:
+        self.conn.close()
+        if self.prewarmed:
+            # The server closed it before we could use it. Stop trying.
+            self.prewarm = False
+        self.prewarmed = False
+        if self.prewarm:
+            logging.debug(f"{self.conn.host} closed the connection. Reconnecting.")
+            try:
+                self.conn.connect()
+                self.prewarmed = True
+            except OSError as e:
+                logging.debug(f"Reconnecting to {self.conn.host} failed: {e}")
+                self.conn.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class Session:
+    """Holds one Connection per scheme and host, and follows redirects."""
+
+    def __init__(self) -> None:
+        self.connections: Dict[str, Connection] = {}
+        self.lock = threading.Lock()
+
+    def connection(self, scheme: str, netloc: str) -> Connection:
+        key = f"{scheme}://{netloc}"
+        with self.lock:
+            if key not in self.connections:
+                self.connections[key] = Connection(scheme, netloc)
+            return self.connections[key]
+
+    @staticmethod
+    def _finish(conn: Connection, r: http.client.HTTPResponse) -> None:
+        r.read(_max_drain)
+        if not r.isclosed():
+            logging.debug(f"Closing {conn.conn.host} rather than reading the rest of the body.")
+            conn.close()
+
+    def wait(self, url: str, timeout: float) -> None:
+        """Sleep for timeout seconds, keeping url's connection ready."""
+        parts = urlsplit(url)
+        self.connection(parts.scheme, parts.netloc).wait(timeout)
+
+    @contextmanager
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                body: Optional[bytes]=None) -> Iterator[http.client.HTTPResponse]:
+        """Yield the response to a request. Afterwards, a short unread body is
+        drained so the connection can be reused for the next poll. A long one
+        isn't worth downloading, so the connection is closed instead."""
+        headers = {'User-Agent': _user_agent, **headers}
+        for redirects in range(_max_redirects + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise ValueError(f"unknown url type: {url!r}")
+            target = parts.path or '/'
+            if parts.query:
+                target += '?' + parts.query
+            conn = self.connection(parts.scheme, parts.netloc)
+            conn.lock.acquire()
+            try:
+                r = conn.request(method, target, headers, body)
+            except BaseException:
+                # http.client is stuck mid-request now (e.g. after a timeout),
+                # so start the next watcher on this host from a fresh socket.
+                conn.close()
+                conn.lock.release()
+                raise
+            location = r.headers.get('Location')
+            if (r.status not in (301, 302, 303, 307, 308) or location is None or
+                redirects == _max_redirects):
+                break  # Yield this response, still holding conn.lock.
+            self._finish(conn, r)
+            conn.lock.release()
+            url = urljoin(url, location)
+            if r.status == 303 and method != 'HEAD':
+                method = 'GET'
+                body = None
+        try:
+            yield r
+            self._finish(conn, r)
+        except BaseException:
+            conn.close()
+            raise
+        finally:
+            r.close()
+            conn.lock.release()
+
+
+# Shared by all watchers, so URLs on one host share one connection.
+session = Session()
+
+
+class Subscription:
+    """A WebSub subscription, updated by WebSubHandler as the hub calls back."""
+
+    def __init__(self, topic: str) -> None:
+        self.topic = topic
+        self.verified = threading.Event()
+        self.pushed = threading.Event()
+        self.denied = False
+        self.lease = _default_lease
+
+
+subscriptions: Dict[str, Subscription] = {}  # Keyed by callback token.
+subscriptions_lock = threading.Lock()
+
+
+class WebSubHandler(BaseHTTPRequestHandler):
+    """Answers hub verification requests and receives content pushes."""
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"WebSub {self.address_string()} {format % args}")
+
+    def _subscription(self) -> Optional[Subscription]:
+        # Match on the last path segment only, since a reverse proxy in front
+        # of us may or may not strip the callback's own path.
+        token = urlsplit(self.path).path.rsplit('/', 1)[-1]
+        with subscriptions_lock:
+            return subscriptions.get(token)
+
+    def _reply(self, code: int, body: bytes=b'') -> None:
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        sub = self._subscription()
+        query = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        if sub is None or query.get('hub.topic') != sub.topic:
+            self._reply(404)
+        elif query.get('hub.mode') == 'denied':
+            logging.warning(f"Hub denied subscription to {sub.topic}: "
+                            f"{query.get('hub.reason')}")
+            sub.denied = True
+            sub.verified.set()
+            sub.pushed.set()  # Wake wait_for_push() so it can fall back to polling.
+            self._reply(200)
+        elif query.get('hub.mode') == 'subscribe' and 'hub.challenge' in query:
+            try:
+                lease = float(query.get('hub.lease_seconds', _default_lease))
+            except ValueError:
+                lease = _default_lease
+            if not 0 < lease < float('inf'):  # Also rejects NaN.
+                lease = _default_lease
+            sub.lease = max(lease, _min_lease)
+            sub.verified.set()
+            self._reply(200, query['hub.challenge'].encode('utf-8'))
+        else:
+            self._reply(404)
+
+    def do_POST(self) -> None:
+        sub = self._subscription()
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if sub is None:
+            self._reply(404)
+            return
+        logging.debug(f"Hub pushed an update of {sub.topic}.")
+        sub.pushed.set()
+        self._reply(202)
+
+
+def find_hub(headers: Message, url: str) -> Optional[Tuple[str, str]]:
+    """Return the WebSub (hub, topic) advertised in Link headers, if any."""
+    links: Dict[str, str] = {}
+    for value in headers.get_all('Link', []):
+        for target, params in re.findall(r'<([^>]*)>((?:\s*;[^;,]*)*)', value):
+            rel = re.search(r';\s*rel\s*=\s*"?([^";,]*)"?', params)
+            if rel is not None:
+                for name in rel.group(1).lower().split():
+                    links.setdefault(name, urljoin(url, target))
+    if 'hub' not in links:
+        return None
+    return links['hub'], links.get('self', url)
+
+
+def subscribe(hub: str, sub: Subscription, token: str) -> bool:
+    """Ask the hub to push updates of sub.topic to our callback."""
+    assert _callback is not None
+    # Append the token to the callback's path, whether or not it ends in '/'.
+    callback = _callback.rstrip('/') + '/' + token
+    body = urlencode({'hub.mode': 'subscribe', 'hub.topic': sub.topic,
+                      'hub.callback': callback}).encode('ascii')
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    sub.verified.clear()
+    try:
+        with session.request('POST', hub, headers, body) as f:
+            if f.status not in (202, 204):
+                logging.error(f"Hub {hub} returned {f.status} for {sub.topic}.")
+                return False
+    except (OSError, http.client.HTTPException) as e:
+        logging.error(f"Couldn't subscribe to {hub} for {sub.topic}: {e}")
+        return False
+    if not sub.verified.wait(_verify_timeout) or sub.denied:
+        logging.error(f"Hub {hub} didn't verify subscription to {sub.topic}.")
+        return False
+    return True
+
+
+def wait_for_push(url: str, hub: str, topic: str) -> bool:
+    """Wait for the hub to tell us url changed. False means fall back to polling."""
+    sub = Subscription(topic)
+    token = secrets.token_urlsafe(16)
+    with subscriptions_lock:
+        subscriptions[token] = sub
+    try:
+        if not subscribe(hub, sub, token):
+            return False
+        logging.info(f"Subscribed to {hub} for {url}.")
+        notify("Watching", url)
+        while True:
+            # Renew a little before the lease runs out.
+            if sub.pushed.wait(sub.lease * 0.9):
+                return not sub.denied
+            if not subscribe(hub, sub, token):
+                return False
+    finally:
+        with subscriptions_lock:
+            del subscriptions[token]
+
+
+def canonical_url(url: str) -> str:
+    """Normalize the parts of url that don't change what it fetches."""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname or ''
+    if ':' in netloc:
+        netloc = f"[{netloc}]"  # IPv6
+    if parts.port is not None and parts.port != {'http': 80, 'https': 443}.get(scheme):
+        netloc += f":{parts.port}"
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo += f":{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
 def watch(url: str, delay: float) -> None:
     """Repeatedly make requests to one URL and watch for changes."""
     # Get ETag and/or Last-Modified, if there is one.
-    req = Request(url)
-    with urlopen(req) as f:
-        if f.getcode() != 200:
-            logging.error(f"Got {f.getcode()} for {url}. Exiting.")
-            notify(f"Got HTTP {f.getcode()}. Exiting.", url)
+    headers: Dict[str, str] = {}
+    with session.request('GET', url, headers) as f:
+        if f.status != 200:
+            logging.error(f"Got {f.status} for {url}. Exiting.")
+            notify(f"Got HTTP {f.status}. Exiting.", url)
             return
-        if 'ETag' in f.headers:
-            req.add_header('If-None-Match', f.headers['ETag'])
-            etag = f.headers['ETag']
-        else:
-            etag = None
-        if 'Last-Modified' in f.headers:
-            req.add_header('If-Modified-Since', f.headers['Last-Modified'])
-            last_modified = f.headers['Last-Modified']
-        else:
-            last_modified = None
-        md5 = get_md5(f)
+        h = f.headers
+        etag = h.get('ETag')
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        last_modified = h.get('Last-Modified')
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+        # A 304 or changed header tells us everything when the server
+        # supports conditional requests, so only hash when it doesn't.
+        supports_conditional = etag is not None or last_modified is not None
+        digest = None if supports_conditional else get_digest(f)
+        # Only compared with later GETs; HEAD lengths are often unreliable.
+        content_length = h.get('Content-Length')
+        fresh_until = time.monotonic() + freshness_lifetime(h)
+        hub = find_hub(h, url)
+
+    if _callback is not None and hub is not None:
+        if wait_for_push(url, *hub):
+            notify("Site changed", url)
+            logging.info(f"Sending notification of change to {url}.")
+            logging.info(f"Stopping for {url}.")
+            return
+        logging.info(f"Falling back to polling {url}.")
 
     logging.debug(f"{url}: ETag={etag} last_modified={last_modified}")
 
     done = False
-    send_confirmation_at: Optional[float] = time.time() + 10  # seconds
+    # Probe with HEAD when headers can tell us about a change, so unchanged
+    # pages don't send their bodies. Otherwise we need the body anyway.
+    probe = 'HEAD' if supports_conditional else 'GET'
+    send_confirmation_at: Optional[float] = time.monotonic() + 10  # seconds
+    next_poll = time.monotonic()
     while not done:
-        time.sleep(delay)
-        if send_confirmation_at is not None and send_confirmation_at < time.time():
+        # Poll on a fixed cadence, so slow responses don't stretch the
+        # interval. If we've fallen behind, poll now rather than in a burst.
+        next_poll = max(next_poll + delay, time.monotonic())
+        session.wait(url, max(0.0, next_poll - time.monotonic()))
+        if send_confirmation_at is not None and send_confirmation_at < time.monotonic():
             logging.info(f"Sending a notification for {url} that we're running.")
             notify("Watching", url)
             send_confirmation_at = None
-        try:
-            with urlopen(req) as f:
-                if f.getcode() != 200:
-                    # Maybe these are all covered by exceptions?
-                    logging.error(f"Got {f.getcode()} for {url}. Continuing.")
-                    continue
-                changed = False
-                if 'ETag' in f.headers and f.headers['ETag'] != etag:
-                    changed = True
-                if ('Last-Modified' in f.headers and
-                    f.headers['Last-Modified'] != last_modified):
-                    changed = True
-                if not changed and md5 != get_md5(f):
-                    changed = True
-                if changed:
-                    notify("Site changed", url)
-                    logging.info(f"Sending notification of change to {url}.")
-                    done = True
-                last_modified = f.headers['Last-Modified']
-        except HTTPError as e:
-            if e.code == 304:
+        if time.monotonic() < fresh_until:
+            continue  # The server said the page won't change before then.
+        with session.request(probe, url, headers) as f:
+            if probe == 'HEAD' and f.status in (405, 501):
+                logging.info(f"{url} doesn't support HEAD. Using GET.")
+                probe = 'GET'
+                continue
+            if f.status == 304:
                 logging.debug(f"{url} not changed.")
-            else:
-                notify(f"Got HTTP error {e.code}. Continuing.", url)
-                logging.error(f"Got {e.code} for {url}. Continuing.")
+                fresh_until = time.monotonic() + freshness_lifetime(f.headers)
+                continue
+            if f.status >= 400:
+                notify(f"Got HTTP error {f.status}. Continuing.", url)
+                logging.error(f"Got {f.status} for {url}. Continuing.")
+                continue
+            if f.status != 200:
+                logging.error(f"Got {f.status} for {url}. Continuing.")
+                continue
+            # Look each header up once; Message lookups scan every header.
+            h = f.headers
+            new_etag = h.get('ETag')
+            new_last_modified = h.get('Last-Modified')
+            new_length = h.get('Content-Length')
+            fresh_until = time.monotonic() + freshness_lifetime(h)
+            if supports_conditional and new_etag is None and new_last_modified is None:
+                if probe == 'HEAD':
+                    # Some servers only send validators for GET.
+                    logging.info(f"{url} sends no ETag or Last-Modified for HEAD. Using GET.")
+                    probe = 'GET'
+                    continue
+                logging.info(f"{url} stopped sending ETag and Last-Modified. Hashing it instead.")
+                supports_conditional = False
+                digest = get_digest(f)
+                content_length = new_length
+                continue
+            changed = ((new_etag is not None and not same_etag(new_etag, etag)) or
+                       (new_last_modified is not None and
+                        new_last_modified != last_modified))
+            # Only hash the body when there are no headers to go by.
+            needs_body = not changed and not supports_conditional
+            if (needs_body and probe == 'GET' and content_length is not None and
+                new_length is not None and new_length != content_length):
+                # A different size is a change; no need to hash the body.
+                changed = True
+                needs_body = False
+            if needs_body:
+                changed = digest != get_digest(f)
+            if new_last_modified is not None:
+                last_modified = new_last_modified
+        if changed:
+            notify("Site changed", url)
+            logging.info(f"Sending notification of change to {url}.")
+            done = True
 
     logging.info(f"Stopping for {url}.")
 
@@ -118,6 +575,10 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--delay', type=float, default=5.0,
                         help='Delay between requests')
     parser.add_argument('-o', '--outfile')
+    parser.add_argument('-c', '--callback',
+                        help='Public URL that WebSub hubs can reach us at')
+    parser.add_argument('-p', '--port', type=int,
+                        help='Port to listen on for WebSub hubs')
     parser.add_argument('urls', nargs='+', help='URLs to watch')
     parser_args = parser.parse_args()
     if parser_args.outfile is None:
@@ -130,18 +591,38 @@ if __name__ == '__main__':
                         level=logging.INFO)
 
     with open(__file__.replace('.py', '.json')) as f:
-       _notification = json.load(f)['notification']
+        set_notification(json.load(f)['notification'])
+
+    if parser_args.callback is not None:
+        _callback = parser_args.callback
+        port = parser_args.port or urlsplit(_callback).port or 80
+        server = ThreadingHTTPServer(('', port), WebSubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
 
     signal.signal(signal.SIGINT, log_exit)
     signal.signal(signal.SIGTERM, log_exit)
 
     logging.info(f'PID={os.getpid()} Starting with -d '
                  f'{parser_args.delay} {" ".join(parser_args.urls)}')
-    if len(parser_args.urls) == 1:
-        watch(parser_args.urls[0], parser_args.delay)
+    # Watch each distinct URL once, no matter how many ways it was spelled.
+    urls: Dict[str, str] = {}
+    for url in parser_args.urls:
+        try:
+            canonical = canonical_url(url)
+        except ValueError as e:
+            # Keep it as given; its watcher will report the problem.
+            logging.warning(f"Can't normalize {url}: {e}")
+            canonical = url
+        if canonical in urls:
+            logging.info(f"{url} is the same as {urls[canonical]}. Watching it once.")
+        else:
+            urls[canonical] = url
+    if len(urls) == 1:
+        watch(next(iter(urls.values())), parser_args.delay)
     else:
+        threading.stack_size(_thread_stack_size)
         threads = []
-        for url in parser_args.urls:
+        for url in urls.values():
             t = threading.Thread(target=watch, args=(url, parser_args.delay),
                                  daemon=True)
             t.start()